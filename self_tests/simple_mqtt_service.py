@@ -1,3 +1,9 @@
+import os
+import logging
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import (
     CallbackAPIVersion,
@@ -6,6 +12,9 @@ from paho.mqtt.enums import (
 from paho.mqtt.reasoncodes import ReasonCode
 from paho.mqtt.packettypes import PacketTypes
 
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("simple_mqtt_service")
+
 # MQTT broker details
 broker_address = "localhost"
 broker_port = 1883
@@ -17,34 +26,77 @@ publish_topic = "hello/pong"
 # MQTT v5 client
 client = mqtt.Client(callback_api_version=CallbackAPIVersion.VERSION2, protocol=MQTTProtocolVersion.MQTTv5)
 
+# Messages are handled on these workers so paho's network loop only has to hand them off.
+pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+# Topic aliases assigned to response topics, up to the broker's TopicAliasMaximum.
+topic_alias_maximum = 0
+topic_aliases: dict[str, int] = dict()
+topic_alias_lock = threading.Lock()
+
 def on_connect(client, userdata, flags, reason_code, properties):
+    global topic_alias_maximum
     if not reason_code.is_failure:
-        print("Connected to MQTT broker")
+        logger.info("Connected to MQTT broker")
+        # Aliases only last for one connection.
+        with topic_alias_lock:
+            topic_alias_maximum = getattr(properties, 'TopicAliasMaximum', 0)
+            topic_aliases.clear()
+        # Replies are small and sent one at a time, so don't let Nagle's algorithm hold them back.
+        if isinstance(sock := client.socket(), socket.socket):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         client.subscribe(subscribe_topic)
     else:
-        print("Connection failed with result code " + str(reason_code))
+        logger.error("Connection failed with result code %s", reason_code)
 
-def on_message(client, userdata, msg: mqtt.MQTTMessage):
-    # Process the received message
-    print(f"Received message: {msg.payload.decode()} {msg.properties}")
+def handle_message(client, msg: mqtt.MQTTMessage):
+    # Process the received message.  The arguments are only formatted if the message is actually logged,
+    # and only the start of the payload is logged so large payloads don't produce huge log lines.
+    logger.info("Received message: %s %s", msg.payload[:64], msg.properties)
 
     response_topic = publish_topic
-    if hasattr(msg.properties, 'ResponseTopic'):
-        response_topic = msg.properties.ResponseTopic
-    
-    resp_props = mqtt.Properties(PacketTypes.PUBLISH)
+    cor_id = None
+    contType = None
+    if (msg_props := msg.properties) is not None:
+        response_topic = getattr(msg_props, 'ResponseTopic', publish_topic)
+        cor_id = getattr(msg_props, 'CorrelationData', None)
+        contType = getattr(msg_props, 'ContentType', None)
+
+    with topic_alias_lock:
+        # A reconnect resets the aliases and their maximum, so both are read, and any reply that uses an
+        # alias is published, while holding the lock.
+        alias = topic_aliases.get(response_topic)
+        topic = "" if alias is not None else response_topic
+        if alias is None and len(topic_aliases) < topic_alias_maximum:
+            # The first reply carries both the topic and its new alias, so no reply using only the alias
+            # can reach the broker ahead of it.
+            alias = topic_aliases[response_topic] = len(topic_aliases) + 1
 
-    if cor_id := getattr(msg.properties, 'CorrelationData', False):
-        resp_props.CorrelationData = cor_id
+        # Only build reply properties when there is something to echo back.
+        resp_props = None
+        if cor_id is not None or contType is not None or alias is not None:
+            resp_props = mqtt.Properties(PacketTypes.PUBLISH)
+            if cor_id is not None:
+                resp_props.CorrelationData = cor_id
+            if contType is not None:
+                resp_props.ContentType = contType
+            if alias is not None:
+                resp_props.TopicAlias = alias
 
-    if contType := getattr(msg.properties, 'ContentType', False):
-        resp_props.ContentType = contType
+        if alias is not None:
+            client.publish(topic, msg.payload, qos=1, properties=resp_props)
+            return
 
-    # Publish the new message
     client.publish(response_topic, msg.payload, qos=1, properties=resp_props)
 
+def on_message(client, userdata, msg: mqtt.MQTTMessage):
+    pool.submit(handle_message, client, msg)
+
 client.on_connect = on_connect
 client.on_message = on_message
 
 client.connect(broker_address, broker_port)
-client.loop_forever()
\ No newline at end of file
+try:
+    client.loop_forever()
+finally:
+    pool.shutdown(wait=True)
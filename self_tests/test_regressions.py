@@ -0,0 +1,290 @@
+""" Runs small suites against a local HTTP server to check behaviour that has regressed before.
+Run with `pytest self_tests/test_regressions.py`; unlike the other self tests, no broker is needed.
+Name the file, since the suites next to it are collected too and need a broker or internet access.
+Dockerfile.test runs these tests while building the self-test image.
+"""
+import io
+import sys
+import json
+import subprocess
+import threading
+from types import SimpleNamespace
+import http.server
+
+import pytest
+from rich.console import Console
+
+from dugway.runner import DugwayRunner
+from dugway.reporter import AbstractReporter, MultiReporter, PlainReporter, LazyPanel
+from dugway.expectations import InvalidTestConfig
+
+
+class JsonObjectHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.dumps({"name": "dugway"}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_port():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), JsonObjectHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def load_suite(tmp_path, suite_yaml: str) -> DugwayRunner:
+    suite_file = tmp_path / "regression.dugway.yaml"
+    suite_file.write_text(suite_yaml)
+    return DugwayRunner(str(suite_file), PlainReporter(io.StringIO()))
+
+
+def test_message_from_json_step_checks_schema(tmp_path, http_port):
+    # A json step converting a single response must hand its JsonContent to mqtt_message, which
+    # used to find an empty JsonMultiContent instead and pass without checking the schema.
+    runner = load_suite(tmp_path, f"""
+services:
+  local_http:
+    type: http
+    hostname: 127.0.0.1
+    port: {http_port}
+
+testCases:
+  objectIsNotAString:
+    steps:
+      - id: request
+        type: http_request
+        service: local_http
+        path: /
+      - id: convert
+        type: json
+        from: request
+      - id: check
+        type: mqtt_message
+        from: convert
+        expect:
+          json_schema:
+            type: string
+""")
+    assert runner.get_suite().run() is False
+
+
+def test_recursive_schema_expectation(tmp_path, http_port):
+    # References are resolved into cyclic dicts, which can't be serialized to share a cached validator.
+    runner = load_suite(tmp_path, f"""
+services:
+  local_http:
+    type: http
+    hostname: 127.0.0.1
+    port: {http_port}
+
+definitions:
+  node:
+    type: object
+    properties:
+      name:
+        type: string
+      children:
+        type: array
+        items:
+          $ref: '#/definitions/node'
+
+testCases:
+  recursiveSchema:
+    steps:
+      - id: request
+        type: http_request
+        service: local_http
+        path: /
+      - id: convert
+        type: json
+        from: request
+        expect:
+          json_schema:
+            $ref: '#/definitions/node'
+""")
+    assert runner.get_suite().run() is True
+
+
+def test_http_suite_only_loads_its_plugins(tmp_path, http_port):
+    # Checked in a fresh interpreter, since other tests in this process may already have imported MQTT.
+    suite_file = tmp_path / "http_only.dugway.yaml"
+    suite_file.write_text(f"""
+services:
+  local_http:
+    type: http
+    hostname: 127.0.0.1
+    port: {http_port}
+
+testCases:
+  request:
+    steps:
+      - type: http_request
+        service: local_http
+        path: /
+""")
+    script = (
+        "import io, sys\n"
+        "from dugway.runner import DugwayRunner\n"
+        "from dugway.reporter import PlainReporter\n"
+        f"DugwayRunner({str(suite_file)!r}, PlainReporter(io.StringIO()))\n"
+        "print('dugway.mqtt' in sys.modules, 'paho.mqtt.client' in sys.modules)\n"
+    )
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    assert output.split() == ["False", "False"]
+
+
+def test_http_service_can_be_set_up_again(tmp_path, http_port):
+    # The pytest plugin sets up and tears down the suite's services around every item.
+    runner = load_suite(tmp_path, f"""
+services:
+  local_http:
+    type: http
+    hostname: 127.0.0.1
+    port: {http_port}
+
+testCases:
+  request:
+    steps:
+      - type: http_request
+        service: local_http
+        path: /
+        expect:
+          status_code: 200
+""")
+    suite = runner.get_suite()
+    for _ in range(2):
+        suite.do_setup()
+        for case_name, test_case in suite.iterate_test_cases():
+            assert suite.do_test_case_execution(case_name, test_case) is True
+        suite.do_teardown()
+
+
+class TwoArgumentReporter(AbstractReporter):
+    """ A reporter written before step_info() took a `kind`. """
+
+    def __init__(self):
+        self.infos = list()
+
+    def start_suite(self, suite_name): pass
+    def end_suite(self, result): pass
+    def start_case(self, case_name): pass
+    def end_case(self, result): pass
+    def start_step(self, step_name): pass
+
+    def step_info(self, title, data):
+        self.infos.append(title)
+
+
+def test_multi_reporter_supports_two_argument_step_info():
+    reporter = TwoArgumentReporter()
+    multi_reporter = MultiReporter([reporter])
+    multi_reporter.step_info("GET Request", "http://localhost/")
+    multi_reporter.step_info("200 Response", "\x08\x96\x01", 'protobuf')
+    assert reporter.infos == ["GET Request", "200 Response"]
+
+
+def test_batch_publish_needs_json_list(tmp_path):
+    # Loading the suite doesn't connect to the broker, so none is needed.
+    with pytest.raises(InvalidTestConfig):
+        load_suite(tmp_path, """
+services:
+  local_mqtt:
+    type: mqtt
+    hostname: localhost
+    protocol: 5
+
+testCases:
+  publish:
+    steps:
+      - type: mqtt_publish
+        service: local_mqtt
+        topic: hello/batch
+        batch: true
+        nullPayload: true
+""")
+
+
+def test_schema_errors_point_at_their_own_step(tmp_path, http_port):
+    # Two steps with the same schema must not share a validator, or both errors point at the first one.
+    suite_file = tmp_path / "regression.dugway.yaml"
+    suite_file.write_text(f"""
+services:
+  local_http:
+    type: http
+    hostname: 127.0.0.1
+    port: {http_port}
+
+testCases:
+  firstStep:
+    steps:
+      - id: request
+        type: http_request
+        service: local_http
+        path: /
+      - type: json
+        from: request
+        expect:
+          json_schema:
+            type: string
+  secondStep:
+    steps:
+      - id: request
+        type: http_request
+        service: local_http
+        path: /
+      - type: json
+        from: request
+        expect:
+          json_schema:
+            type: string
+""")
+    output = io.StringIO()
+    DugwayRunner(str(suite_file), PlainReporter(output)).get_suite().run()
+    first, second = [line.split("schema line")[1] for line in output.getvalue().splitlines() if "schema line" in line]
+    assert first != second
+
+
+@pytest.mark.parametrize("filter_yaml", ["", "filter: {json_schema: {type: object}}"])
+def test_subscription_only_counts_json_messages(tmp_path, filter_yaml):
+    # Messages are handed to the subscription directly, so no broker is needed.
+    runner = load_suite(tmp_path, f"""
+services:
+  local_mqtt:
+    type: mqtt
+    hostname: localhost
+
+testCases:
+  subscribe:
+    steps:
+      - id: subscription
+        type: mqtt_subscribe
+        service: local_mqtt
+        topic: hello/pong
+        {filter_yaml}
+""")
+    subscription = runner.get_suite()._cases["subscribe"].get_step("subscription")
+    for payload in (b'{"name": "dugway"}', b'not json'):
+        subscription._receive_message(None, None, SimpleNamespace(topic="hello/pong", payload=payload, properties=None))
+    json_multi = subscription.find_capability("JsonMultiContent")
+    assert json_multi.count == 1
+    assert json_multi.get() == {"name": "dugway"}
+
+
+@pytest.mark.parametrize("data", [42, {"status": 200}, object()])
+def test_step_info_panel_falls_back_to_repr(data):
+    # Panels are built on the live display's refresh thread, where an error would break the display.
+    console = Console(file=io.StringIO(), width=80)
+    console.print(LazyPanel("Response", data))
+    assert repr(data) in console.file.getvalue()
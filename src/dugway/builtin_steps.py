@@ -3,18 +3,22 @@ from .step import TestStep
 from .meta import JsonConfigType, JsonSchemaType
 from time import sleep
 from typing import Any
-import json
-import jsonpath
+import functools
+import orjson
 from .capabilities import JsonContentCapability, JsonMultiContentCapability, FromStep, JsonSchemaExpectation, ValueCapability, MultiValueCapability
 from . import expectations
 from .service import Service
 class Sleep(TestStep):
+
+    __slots__ = ('_time_to_sleep',)
     
     def __init__(self, runner, config: JsonConfigType):
         super().__init__(runner, config)
         self._time_to_sleep = int(runner.template_eval(config.get('time', 1)))
 
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "properties": {
                 "time": {
@@ -28,38 +32,43 @@ class Sleep(TestStep):
 
 class ConvertToJson(TestStep):
 
+    __slots__ = ('json_content_cap', 'json_multi_cap', 'from_step', '_js_expect')
+
     def __init__(self, runner, config: JsonConfigType):
         self.json_content_cap = JsonContentCapability(runner, config)
         self.json_multi_cap = JsonMultiContentCapability(runner, config)
-        from_step = FromStep(runner, config)
+        self.from_step = FromStep(runner, config)
         self._js_expect = JsonSchemaExpectation(runner, config)
-        super().__init__(runner, config, [from_step, self._js_expect, self.json_content_cap])
+        # JsonMultiContent is only advertised once the 'from' step turns out to provide several messages,
+        # otherwise steps that prefer it would find it empty instead of using the single JsonContent.
+        super().__init__(runner, config, [self.from_step, self._js_expect, self.json_content_cap])
 
     def get_config_schema(self) -> JsonSchemaType:
-        return dict()
+        return True
 
     def check_json(self, json_data:dict[str,Any]):
         if not self._js_expect.check_against_json_schema(json_data):
             raise expectations.FailedTestStep("Message payload did not match json schema")
         
     def run(self):
-        from_step = self.get_capability("FromStep").get_step()
+        from_step = self.from_step.get_step()
         if textual := from_step.find_capability("TextContent"):
-            resp_json = json.loads(textual.response_body)
+            resp_json = orjson.loads(textual.response_body)
             self.check_json(resp_json)
             self.json_content_cap.json_content = resp_json
         elif multi_textual := from_step.find_capability("TextMultiContent"):
-            content = self.multi_textual.get_or_none()
-            while content is not None:
-                json_content = json.loads(content)
+            self.add_capability(self.json_multi_cap)
+            for content in multi_textual.drain():
+                json_content = orjson.loads(content)
                 self.check_json(json_content)
                 self.json_multi_cap.add_content(json_content)
-                content = self.multi_textual.get_or_none()
         else:
             raise expectations.FailedTestStep("The 'from' step did not provide a textual response body")
 
 class JsonPath(TestStep):
 
+    __slots__ = ('value_cap', 'multi_value_cap', 'from_step', '_match_count', '_match_path', '_compiled_path', '_pointer')
+
     def __init__(self, runner, config: JsonConfigType):
         self.value_cap = ValueCapability(runner, config)
         self.multi_value_cap = MultiValueCapability(runner, config)
@@ -67,8 +76,21 @@ class JsonPath(TestStep):
         super().__init__(runner, config, [self.from_step, self.value_cap, self.multi_value_cap])
         self._match_count = 0
         self._match_path = "Match"
+        # python-jsonpath is slow to import and only this step uses it, so it is imported on first use.
+        import jsonpath
+        # The path or pointer is parsed once here rather than for every document searched.
+        self._compiled_path = None
+        self._pointer = None
+        if path := config.get("path"):
+            self._match_path = path
+            self._compiled_path = jsonpath.compile(path)
+        elif pointer_str := config.get("pointer"):
+            self._match_path = pointer_str
+            self._pointer = jsonpath.JSONPointer(pointer_str)
 
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "oneOf": [
                 {
@@ -100,18 +122,14 @@ class JsonPath(TestStep):
         }
         
     def _search(self, data):
-        if path := self._config.get("path"):
-            self._match_path = path
-            matches = jsonpath.finditer(path, data)
-            for match in matches:
+        if self._compiled_path is not None:
+            for match in self._compiled_path.finditer(data):
                 if not self.value_cap.is_set:
                     self.value_cap.set(match.value)
                 self.multi_value_cap.add_content(match.value)
                 self._match_count += 1
-        elif pointer_str := self._config.get("pointer"):
-            self._match_path = pointer_str
-            pointer = jsonpath.JSONPointer(pointer_str)
-            value = pointer.resolve(data)
+        elif self._pointer is not None:
+            value = self._pointer.resolve(data)
             if not self.value_cap.is_set:
                 self.value_cap.set(value)
             self.multi_value_cap.add_content(value)
@@ -119,18 +137,17 @@ class JsonPath(TestStep):
 
     def run(self):
         found_source = False
-        if json_content_cap := self.from_step.get_step().find_capability("JsonContent"):
+        source_step = self.from_step.get_step()
+        if json_content_cap := source_step.find_capability("JsonContent"):
             found_source = True
             self._search(json_content_cap.json_content)
             self._runner._reporter.step_info(f"Match against '{self._match_path}'", str(self.value_cap.get()))
-        if multi_json_content_cap := self.from_step.get_step().find_capability("JsonMultiContent"):
+        if multi_json_content_cap := source_step.find_capability("JsonMultiContent"):
             found_source = True
-            content = multi_json_content_cap.get_or_none()
-            while content is not None:
+            for content in multi_json_content_cap.drain():
                 self._search(content)
-                content = multi_json_content_cap.get_or_none()
         if not found_source:
-            raise expectations.FailedTestStep(f"The 'from' step '{self.from_step.get_step().get_name()}' did not provide JSON content")
+            raise expectations.FailedTestStep(f"The 'from' step '{source_step.get_name()}' did not provide JSON content")
         min_matches = self._config.get("minimum", 0)
         if self._match_count < min_matches:
             raise expectations.FailedTestStep("Only found {self._match_count} matches but {min_matches} were required.")
@@ -139,11 +156,15 @@ class JsonPath(TestStep):
 
 class ValueSave(TestStep):
 
+    __slots__ = ('from_step',)
+
     def __init__(self, runner, config: JsonConfigType):
         self.from_step = FromStep(runner, config)
         super().__init__(runner, config, [self.from_step])
 
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "properties": {
                 "suite": {
@@ -165,10 +186,14 @@ class ValueSave(TestStep):
 
 class AddService(TestStep):
 
+    __slots__ = ()
+
     def __init__(self, runner, config: JsonConfigType):
         super().__init__(runner, config, [self.from_step])
 
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "properties": {
                 "name": {
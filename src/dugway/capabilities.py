@@ -1,14 +1,18 @@
-from typing import Any
-import json
-from queue import Queue, Empty as QueueEmpty
+from typing import Any, Iterator
+import functools
+from collections import deque
+from threading import Condition
 
+import orjson
 from jacobsjsonschema.draft7 import Validator as JsonSchemaValidator
 
-from .meta import JsonSchemaDefinedClass, JsonSchemaType, JsonConfigType
+from .meta import JsonSchemaDefinedClass, JsonSchemaType, JsonConfigType, get_validator
 
 
 class JsonSchemaDefinedCapability(JsonSchemaDefinedClass):
-    
+
+    __slots__ = ('_name', '_runner')
+
     def __init__(self, name: str, runner, config: dict[str, Any]):
         super().__init__(config)
         self._name = name
@@ -24,6 +28,8 @@ class JsonSchemaDefinedCapability(JsonSchemaDefinedClass):
 
 class JsonContentCapability(JsonSchemaDefinedCapability):
 
+    __slots__ = ('_response_body',)
+
     def __init__(self, runner, config: JsonConfigType):
         super().__init__("JsonContent", runner, config)
         self._response_body: dict[str, Any]|None = None
@@ -36,14 +42,16 @@ class JsonContentCapability(JsonSchemaDefinedCapability):
     def json_content(self, json_resp_body: dict[str, Any]):
         self._response_body = json_resp_body
 
-    def set_json_response_from_string(self, json_text: str):
-        self._response_body = json.loads(json_text)
+    def set_json_response_from_string(self, json_text: str|bytes):
+        self._response_body = orjson.loads(json_text)
 
     def get_config_schema(self) -> JsonSchemaType:
         return True
 
 class TextContentCapability(JsonSchemaDefinedCapability):
 
+    __slots__ = ('_response_body',)
+
     def __init__(self, runner, config: JsonConfigType):
         super().__init__("TextContent", runner, config)
         self._response_body: str|None = None
@@ -62,62 +70,99 @@ class TextContentCapability(JsonSchemaDefinedCapability):
 
 class TextMultiContentCapability(JsonSchemaDefinedCapability):
 
+    __slots__ = ('_messages',)
+
     def __init__(self, runner, config: JsonConfigType):
         super().__init__("TextMultiContent", runner, config)
-        self._messages = Queue()
+        # Only the step that owns this capability adds and takes content, so no locking is needed.
+        self._messages = deque()
 
     @property
     def count(self):
-        return self._messages.qsize()
+        return len(self._messages)
 
     def get(self) -> str:
-        return self._messages.get()
+        return self._messages.popleft()
 
     def get_or_none(self) -> str|None:
         try:
-            self._messages.get_nowait()
-        except QueueEmpty:
+            return self._messages.popleft()
+        except IndexError:
             return None
 
+    def drain(self) -> Iterator[str]:
+        """ Yields and removes every held message, stopping once none are left.
+        """
+        while (content := self.get_or_none()) is not None:
+            yield content
+
     def add_content(self, content: str):
-        self._messages.put(content)
+        self._messages.append(content)
 
     def get_config_schema(self) -> JsonSchemaType:
         return True
     
     def __repr__(self) -> str:
-        return f"<TextMultiContent {self._name} {self._messages.qsize()} message count>"
+        return f"<TextMultiContent {self._name} {len(self._messages)} message count>"
 
 class JsonMultiContentCapability(JsonSchemaDefinedCapability):
 
+    __slots__ = ('_messages', '_arrived')
+
     def __init__(self, runner, config: JsonConfigType):
         super().__init__("JsonMultiContent", runner, config)
-        self._messages = Queue()
+        # Appending and popping a deque are atomic, so the condition is only used to wait for content.
+        # It is notified whenever content is added, so waiters wake as soon as a message arrives.
+        self._messages = deque()
+        self._arrived = Condition()
 
     @property
     def count(self):
-        return self._messages.qsize()
+        return len(self._messages)
 
     def get(self) -> dict[str, Any]:
-        return self._messages.get()
+        with self._arrived:
+            self._arrived.wait_for(lambda: len(self._messages) > 0)
+            return self._messages.popleft()
 
     def get_or_none(self) -> dict[str, Any]|None:
         try:
-            self._messages.get_nowait()
-        except QueueEmpty:
+            return self._messages.popleft()
+        except IndexError:
             return None
 
+    def drain(self) -> Iterator[Any]:
+        """ Yields and removes every held message, stopping once none are left.
+        """
+        while True:
+            try:
+                content = self._messages.popleft()
+            except IndexError:
+                return
+            yield content
+
+    def wait_for_count(self, count: int, timeout: float|None=None) -> bool:
+        """ Blocks until at least `count` messages are held or `timeout` seconds pass.
+        Returns True if the count was reached.
+        """
+        with self._arrived:
+            return self._arrived.wait_for(lambda: len(self._messages) >= count, timeout)
+
     def add_content(self, json_resp: dict[str, Any]):
-        self._messages.put(json_resp)
+        with self._arrived:
+            self._messages.append(json_resp)
+            self._arrived.notify_all()
 
     def get_config_schema(self) -> JsonSchemaType:
         return True
     
     def __repr__(self) -> str:
-        return f"<JsonMultiContent {self._name} {self._messages.qsize()} message count>"
+        return f"<JsonMultiContent {self._name} {len(self._messages)} message count>"
 
 class ValueCapability(JsonSchemaDefinedCapability):
 
+    __slots__ = ('_value', '_is_set')
+
     def __init__(self, runner, config: JsonConfigType):
         super().__init__("Value", runner, config)
         self._value = None
@@ -142,38 +187,46 @@ class ValueCapability(JsonSchemaDefinedCapability):
 
 class MultiValueCapability(JsonSchemaDefinedCapability):
 
+    __slots__ = ('_value',)
+
     def __init__(self, runner, config: JsonConfigType):
         super().__init__("MultiValue", runner, config)
-        self._value = Queue()
+        # Only the step that owns this capability adds and takes values, so no locking is needed.
+        self._value = deque()
 
     @property
     def count(self):
-        return self._value.qsize()
+        return len(self._value)
 
     def get(self) -> Any:
-        return self._value.get()
+        return self._value.popleft()
 
     def get_or_none(self) -> Any|None:
         try:
-            self._value.get_nowait()
-        except QueueEmpty:
+            return self._value.popleft()
+        except IndexError:
             return None
 
     def add_content(self, value: Any):
-        self._value.put(value)
+        self._value.append(value)
 
     def get_config_schema(self) -> JsonSchemaType:
         return True
     
     def __repr__(self) -> str:
-        return f"<MultiValue {self._name} {self._messages.qsize()} message count>"
+        return f"<MultiValue {self._name} {len(self._value)} message count>"
 
 class ServiceDependency(JsonSchemaDefinedCapability):
 
+    __slots__ = ('_service',)
+
     def __init__(self, runner, config: JsonConfigType):
         super().__init__("ServiceDependency", runner, config)
+        self._service = None
 
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "type": "object",
             "properties": {
@@ -184,15 +237,27 @@ class ServiceDependency(JsonSchemaDefinedCapability):
             "required": ["service"]
         }
 
+    @property
+    def service_id(self) -> str:
+        return self._config['service']
+
     def get_service(self):
-        return self._runner.get_service(self._config.get('service'))
+        # Services live for the whole suite, so the lookup is only done the first time.
+        if self._service is None:
+            self._service = self._runner.get_service(self.service_id)
+        return self._service
 
 class FromStep(JsonSchemaDefinedCapability):
 
+    __slots__ = ('_step',)
+
     def __init__(self, runner, config: JsonConfigType):
         super().__init__("FromStep", runner, config)
+        self._step = None
     
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "type": "object",
             "properties": {
@@ -203,18 +268,33 @@ class FromStep(JsonSchemaDefinedCapability):
             "required": ["from"]
         }
     
+    @property
+    def from_step_id(self) -> str:
+        return self._config['from']
+
     def get_step(self):
-        from_step_id = self._config.get('from')
-        return self._runner.get_step(from_step_id)
+        # Referenced steps belong to the same test case as this one, so the lookup is only done the first time.
+        if self._step is None:
+            self._step = self._runner.get_step(self.from_step_id)
+        return self._step
     
 
 class JsonSchemaExpectation(JsonSchemaDefinedCapability):
 
+    __slots__ = ('json_schema', '_validator')
+
     def __init__(self, runner, config: JsonConfigType):
         super().__init__("JsonSchemaExpect", runner, config)
-        self.json_schema = self._config["expect"]["json_schema"]
+        self.json_schema = self._config.get("expect", dict()).get("json_schema")
+        # The validator is built when the config is loaded rather than on every check.
+        if self.json_schema is not None:
+            self._validator = get_validator(self.json_schema)
+        else:
+            self._validator = None
     
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "type": "object",
             "properties": {
@@ -228,22 +308,39 @@ class JsonSchemaExpectation(JsonSchemaDefinedCapability):
         }
     
     def check_against_json_schema(self, data: dict[str, Any]):
-        if "expect" not in self._config and "json_schema" not in self._config["expect"]:
+        if self._validator is None:
             return True
-        validator = JsonSchemaValidator(self.json_schema)
-        try:
-            validator.validate(data)
-        except Exception as e:
-            raise e
-            return False
+        self._validator.validate(data) # Throws exceptions if invalid
         return True
     
+def required_keys_only(schema: JsonSchemaType) -> tuple[str, ...]|None:
+    """ If the schema does nothing more than require an object with certain keys, returns those keys.
+    Otherwise returns None.
+    """
+    if not isinstance(schema, dict) or schema.get("type") != "object":
+        return None
+    if not set(schema.keys()) <= {"type", "required"}:
+        return None
+    return tuple(schema.get("required", []))
+
 class JsonSchemaFilter(JsonSchemaDefinedCapability):
 
+    __slots__ = ('_validator', '_required_keys')
+
     def __init__(self, runner, config: JsonConfigType):
         super().__init__("JsonSchemaFilter", runner, config)
+        # Messages are checked against the filter as they arrive, so build the validator up front.
+        if (json_schema := self._config.get("filter", dict()).get("json_schema")) is not None:
+            self._validator = JsonSchemaValidator(json_schema)
+            # The most common filters only require some keys, which can be checked without the validator.
+            self._required_keys = required_keys_only(json_schema)
+        else:
+            self._validator = None
+            self._required_keys = None
     
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "type": "object",
             "properties": {
@@ -256,16 +353,28 @@ class JsonSchemaFilter(JsonSchemaDefinedCapability):
             },
         }
     
-    def check_against_json_schema(self, json_text: str):
-        if "filter" not in self._config or "json_schema" not in self._config["filter"]:
+    @property
+    def is_filtering(self) -> bool:
+        return self._validator is not None
+
+    def check_against_json_schema(self, json_text: str|bytes):
+        if self._validator is None:
             return True
         try:
-            json_value = json.loads(json_text)
-        except:
+            json_value = orjson.loads(json_text)
+        except orjson.JSONDecodeError:
             return False
-        validator = JsonSchemaValidator(self._config["filter"]["json_schema"])
+        return self.check_json_value(json_value)
+
+    def check_json_value(self, json_value: Any) -> bool:
+        """ Like check_against_json_schema, but for JSON that has already been deserialized.
+        """
+        if self._validator is None:
+            return True
+        if self._required_keys is not None:
+            return isinstance(json_value, dict) and all(key in json_value for key in self._required_keys)
         try:
-            validator.validate(json_value)
+            self._validator.validate(json_value)
         except Exception as e:
             return False
         return True
\ No newline at end of file
@@ -1,14 +1,14 @@
 
 from typing import Any, LiteralString
-
-from stevedore import driver
+import functools
 
 from .meta_class import JsonSchemaDefinedObject
 from .step import TestStep
 from .meta import JsonConfigType, JsonSchemaType
 from .reporter import AbstractReporter
 from .builtin_steps import BUILTIN_STEPS
-from .expectations import FailedTestStep
+from .plugins import load_plugin, STEP_PLUGIN_GROUP
+from .expectations import FailedTestStep, InvalidTestConfig
 
 class TestCase(JsonSchemaDefinedObject):
     """ A test suite is made up of 1+ test cases.  Each test case contains 1+ test steps.
@@ -16,6 +16,8 @@ class TestCase(JsonSchemaDefinedObject):
     it fails.
     """
 
+    __slots__ = ('_runner', '_steps_by_id', '_setup', '_teardown', '_steps', '_reporter', '_variables', '_current_step')
+
     def __init__(self, name: str, runner, config: JsonConfigType, reporter: AbstractReporter):
         super().__init__(config)
         self._runner = runner
@@ -30,24 +32,14 @@ class TestCase(JsonSchemaDefinedObject):
 
     def _add_steps(self, config, dest_list: list[TestStep]):
         for step_config in config.get('steps', []):
-            if step_config['type'] in BUILTIN_STEPS:
-                step = BUILTIN_STEPS[step_config['type']](self._runner, step_config)
-                dest_list.append(step)
-                if step_id := step_config.get('id'):
-                    self._steps_by_id[step_id] = step
-            else:
-                step_mgr = driver.DriverManager(
-                    namespace='dugwayteststep',
-                    name=step_config['type'],
-                    invoke_on_load=True,
-                    invoke_kwds={
-                        "runner": self._runner,
-                        "config": step_config,
-                    }
-                )
-                dest_list.append(step_mgr.driver)
-                if step_id := step_config.get('id'):
-                    self._steps_by_id[step_id] = step_mgr.driver
+            step_type = step_config['type']
+            step_class = BUILTIN_STEPS.get(step_type) or load_plugin(STEP_PLUGIN_GROUP, step_type)
+            if step_class is None:
+                raise InvalidTestConfig(f"No test step of type '{step_type}' is installed")
+            step = step_class(runner=self._runner, config=step_config)
+            dest_list.append(step)
+            if step_id := step_config.get('id'):
+                self._steps_by_id[step_id] = step
 
     def add_setup(self, setup_config):
         self._add_steps(setup_config, self._setup)
@@ -94,6 +86,7 @@ class TestCase(JsonSchemaDefinedObject):
         return result
 
     @classmethod
+    @functools.cache
     def get_generic_schema(cls) -> JsonSchemaType:
         return {
             "type": "object",
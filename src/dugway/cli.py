@@ -1,13 +1,18 @@
-
-from .runner import DugwayRunner
-from .reporter import MultiReporter, RichReporter, JunitReporter
-from .expectations import InvalidTestConfig
 import typer
 from sys import exit
 
+app = typer.Typer(add_completion=False)
 
+@app.command()
 def run(path:str):
-    reporter = MultiReporter([RichReporter(), JunitReporter("/tmp/junit.xml")])
+    # Imported here so that `--help` doesn't pay for loading the runner and its dependencies.
+    from .runner import DugwayRunner
+    from rich.console import Console
+    from .reporter import MultiReporter, RichReporter, PlainReporter, JunitReporter
+    from .expectations import InvalidTestConfig
+    # A live tree can only be drawn on a terminal, so other output gets plain lines.
+    console_reporter = RichReporter() if Console().is_terminal else PlainReporter()
+    reporter = MultiReporter([console_reporter, JunitReporter("/tmp/junit.xml")])
     try:
         tr = DugwayRunner(path, reporter)
     except InvalidTestConfig as e:
@@ -16,7 +21,7 @@ def run(path:str):
     tr.run()
 
 def entrypoint():
-    typer.run(run)
+    app()
 
 if __name__ == '__main__':
     entrypoint()
@@ -1,6 +1,6 @@
-
 from typing import Any
 from abc import ABC, abstractmethod
+import json
 from jacobsjsonschema.draft7 import (
     Validator as JsonSchemaValidator,
     JsonSchemaValidationError
@@ -10,11 +10,41 @@ from .expectations import InvalidTestConfig
 JsonConfigType = dict[str,Any]
 JsonSchemaType = bool|dict[str,Any]
 
+_validators: dict[str, JsonSchemaValidator] = dict()
+_document_validators: dict[int, tuple[JsonSchemaType, JsonSchemaValidator]] = dict()
+
+def get_validator(schema: JsonSchemaType) -> JsonSchemaValidator:
+    """ Returns a validator for the schema.  Validators for schemas built in code, which are plain dicts,
+    are shared between all schemas with the same canonical JSON representation, so each distinct schema
+    is only built once.  Schemas read from a suite document carry the lines that validation errors point
+    to, so each of those gets a validator of its own.  So do plain dicts that can't be serialized.
+    """
+    if type(schema) is not dict:
+        try:
+            return _document_validators[id(schema)][1]
+        except KeyError:
+            validator = JsonSchemaValidator(schema)
+            # The schema is kept alive with its validator, so its id can't be reused by another schema.
+            _document_validators[id(schema)] = (schema, validator)
+            return validator
+    try:
+        key = json.dumps(schema, sort_keys=True)
+    except (ValueError, TypeError):
+        return JsonSchemaValidator(schema)
+    try:
+        return _validators[key]
+    except KeyError:
+        validator = JsonSchemaValidator(schema)
+        _validators[key] = validator
+        return validator
+
 class JsonSchemaDefinedClass(ABC):
     """ This is an abstract base class for an object which is defined by a config dictionary,
     and the contents of that dictionary are defined by a JSON Schema.
     """
 
+    __slots__ = ('_config',)
+
     def __init__(self, config: JsonConfigType):
         self._config = config
         # This will throw if the config does not conform to the schema.
@@ -30,7 +60,20 @@ class JsonSchemaDefinedClass(ABC):
     def config_complies_with_schema(self, config: JsonConfigType) -> bool:
         """ Checks that the config confirms to the schema.
         """
-        validator = JsonSchemaValidator(self.get_config_schema())
+        schema = self.get_config_schema()
+        # Boolean schemas accept or reject everything, so there is nothing for a validator to do.
+        if schema is True:
+            return True
+        if schema is False:
+            raise InvalidTestConfig("Invalid test config: no config is allowed")
+        # Classes with a static (cached) schema return the same object every time, so the
+        # validator can be found by identity without re-serializing the schema.
+        cached = getattr(type(self), '_cached_schema_validator', None)
+        if cached is not None and cached[0] is schema:
+            validator = cached[1]
+        else:
+            validator = get_validator(schema)
+            type(self)._cached_schema_validator = (schema, validator)
         try:
             validator.validate(config) # Throws exceptions if invalid
         except JsonSchemaValidationError as e:
@@ -4,8 +4,11 @@ from .capabilities import JsonSchemaDefinedCapability
 from .expectations import InvalidTestConfig
 
 class JsonSchemaDefinedObject(JsonSchemaDefinedClass):
+
+    __slots__ = ('_capabilities', '_config_schema')
     
     def __init__(self, config: JsonConfigType, capabilities=None):
+        self._config_schema: JsonSchemaType|None = None
         if capabilities is None:
             self._capabilities = dict()
         else:
@@ -14,6 +17,7 @@ class JsonSchemaDefinedObject(JsonSchemaDefinedClass):
     
     def add_capability(self, capability: JsonSchemaDefinedCapability):
         self._capabilities[capability.name] = capability
+        self._config_schema = None
 
     def has_capability(self, capability_name) -> bool:
         return capability_name in self._capabilities
@@ -43,17 +47,30 @@ class JsonSchemaDefinedObject(JsonSchemaDefinedClass):
         """ Returns the complete schema for the JSON provided to the object.
         This includes the schemas provided by capabilities, and a generic schema
         that applies even when this base class is specialized.
+        The schema is built once and kept until a capability is added.  When nothing
+        constrains the config, the schema is simply True, and a single schema is used as is.
         """
+        if self._config_schema is not None:
+            return self._config_schema
         allof_list = list()
+        # Capabilities with a static schema share one dict, which only needs to be checked once.
+        seen_schemas = set()
         for cap in self._capabilities.values():
             cap_schema = cap.get_config_schema()
-            if cap_schema is not True:
+            if cap_schema is not True and id(cap_schema) not in seen_schemas:
+                seen_schemas.add(id(cap_schema))
                 allof_list.append(cap_schema)
         if self.get_object_schema() is not True:
             allof_list.append(self.get_object_schema())
         if self.get_generic_schema() is not True:
             allof_list.append(self.get_generic_schema())
         
-        return {
-            "allOf": allof_list
-        }
\ No newline at end of file
+        if len(allof_list) == 0:
+            self._config_schema = True
+        elif len(allof_list) == 1:
+            self._config_schema = allof_list[0]
+        else:
+            self._config_schema = {
+                "allOf": allof_list
+            }
+        return self._config_schema
\ No newline at end of file
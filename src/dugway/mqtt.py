@@ -1,13 +1,14 @@
 
 from typing import Callable, Any
-import json
-from datetime import datetime, timedelta
-from time import sleep
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
+import orjson
 import paho.mqtt.client as mqtt_client
 import paho.mqtt.properties as props
 from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.enums import CallbackAPIVersion
 from jacobsjsonschema.draft7 import Validator as JsonSchemaValidator
 
 from .runner import DugwayRunner
@@ -17,7 +18,7 @@ from .meta import JsonConfigType, JsonSchemaType
 from .capabilities import (
     JsonSchemaDefinedCapability,
     ServiceDependency,
-    JsonMultiContent,
+    JsonMultiContentCapability,
     FromStep,
     JsonSchemaExpectation,
     JsonSchemaFilter,
@@ -26,13 +27,72 @@ from . import expectations
 
 logger = logging.getLogger(__name__)
 
+# Maps the config names of MQTTv5 publish properties to their paho property names.
+PUBLISH_PROPERTY_NAMES = (
+    ('payloadFormatIndicator', 'PayloadFormatIndicator'),
+    ('messageExpiryInterval', 'MessageExpiryInterval'),
+    ('responseTopic', 'ResponseTopic'),
+    ('correlationData', 'CorrelationData'),
+    ('contentType', 'ContentType'),
+)
+
+# Maps the config's protocol version numbers to paho's protocol constants.
+MQTT_PROTOCOLS = {
+    3.1: mqtt_client.MQTTv31,
+    3.11: mqtt_client.MQTTv311,
+    5: mqtt_client.MQTTv5,
+}
+
+def _json_default(obj: Any) -> Any:
+    """ orjson doesn't serialize float subclasses, such as the floats in a parsed config document.
+    """
+    if isinstance(obj, float):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def _variable_byte_integer(value: int) -> bytes:
+    """ Encodes a non-negative integer the way MQTT encodes lengths: 7 bits per byte, least significant
+    first, with the high bit set on every byte except the last.
+    """
+    encoded = bytearray()
+    while True:
+        value, digit = divmod(value, 128)
+        if value > 0:
+            encoded.append(digit | 0x80)
+        else:
+            encoded.append(digit)
+            return bytes(encoded)
+
+def encode_batch(payloads: list[bytes]) -> bytes:
+    """ Joins several payloads into the payload of a single batch message, each one prefixed by its length.
+    """
+    return b''.join(_variable_byte_integer(len(payload)) + payload for payload in payloads)
+
+def set_batch_properties(properties: props.Properties, batch_size: int):
+    """ Adds the user properties that mark a message's payload as a batch of `batch_size` payloads.
+    """
+    properties.UserProperty = [('batch-format', 'v1'), ('batch-size', str(batch_size))]
+
 class MqttPropertiesComparingCapability(JsonSchemaDefinedCapability):
 
+    __slots__ = ('_parent_json_property', '_expected_properties')
+
     def __init__(self, runner, config: JsonConfigType, parent_json_property: str):
         self._parent_json_property = parent_json_property
         super().__init__("MqttProperties", runner, config)
+        # The expected properties are fixed by the config, so resolve them once rather than per message.
+        parent_obj = self._config.get(self._parent_json_property, dict())
+        expected_pub_props = parent_obj.get('publishProperties', dict())
+        expected_properties: list[tuple[str, Any]] = list()
+        for config_name, property_name in PUBLISH_PROPERTY_NAMES:
+            if (expected := expected_pub_props.get(config_name, None)) is not None:
+                if config_name == 'correlationData':
+                    expected = expected.encode()
+                expected_properties.append((property_name, expected))
+        self._expected_properties = tuple(expected_properties)
         
     @classmethod
+    @functools.cache
     def publish_property_schema(cls) -> JsonSchemaType:
         return {
             "type": "object",
@@ -45,49 +105,46 @@ class MqttPropertiesComparingCapability(JsonSchemaDefinedCapability):
             },
         }
     
-    def get_config_schema(self) -> JsonSchemaType:
-        schema = {
+    @classmethod
+    @functools.cache
+    def parent_property_schema(cls, parent_json_property: str) -> JsonSchemaType:
+        return {
             "type": "object",
             "properties": {
-                self._parent_json_property: self.publish_property_schema(),
+                parent_json_property: cls.publish_property_schema(),
             },
         }
-        return schema
+
+    def get_config_schema(self) -> JsonSchemaType:
+        return self.parent_property_schema(self._parent_json_property)
+
+    @property
+    def is_filtering(self) -> bool:
+        return len(self._expected_properties) > 0
 
     def properties_match(self, pub_props) -> bool:
-        parent_obj = self._config.get(self._parent_json_property, dict())
-        if (expected_pub_props := parent_obj.get('publishProperties', False)) is not False:
-            if (p_f_i := expected_pub_props.get('payloadFormatIndicator', False)) is not False:
-                if p_f_i != pub_props.PayloadFormatIndicator:
-                    return False
-            if (m_e_i := expected_pub_props.get('messageExpiryInterval', False)) is not False:
-                if m_e_i != pub_props.MessageExpiryInterval:
-                    return False
-            if (r_t := expected_pub_props.get('responseTopic', False)) is not False:
-                if r_t != pub_props.ResponseTopic:
-                    return False
-            if (c_d := expected_pub_props.get('correlationData', False)) is not False:
-                if c_d.encode() != pub_props.CorrelationData:
-                    return False
-            if (c_t := expected_pub_props.get('contentType', False)) is not False:
-                if c_t != pub_props.ContentType:
-                    return False
+        for property_name, expected in self._expected_properties:
+            if getattr(pub_props, property_name, None) != expected:
+                return False
         return True
 
 class MqttService(Service):
 
+    __slots__ = ('is_v5', 'publish', 'client', '_subscriptions', '_connect_args', '_connect_props', '_dispatcher')
+
     def __init__(self, runner: DugwayRunner, config: JsonConfigType):
         super().__init__(runner, config)
-        kwargs = dict()
+        kwargs = {
+            'callback_api_version': CallbackAPIVersion.VERSION2,
+        }
         if client_id := config.get('clientId', False):
             kwargs['client_id'] = self._runner.template_eval(client_id)
-        if protoc := config.get('protocol', False):
-            kwargs['protocol'] = {
-                3.1: mqtt_client.MQTTv31,
-                3.11: mqtt_client.MQTTv311,
-                5: mqtt_client.MQTTv5,
-            }[protoc]
+        # 'protocol' is the older spelling of 'protocolVersion' and is still accepted.
+        if protoc := config.get('protocolVersion', config.get('protocol', False)):
+            kwargs['protocol'] = MQTT_PROTOCOLS[protoc]
         self.is_v5 = (protoc == 5)
+        # The protocol is fixed for the life of the service, so pick the matching publish once.
+        self.publish = self._publish_v5 if self.is_v5 else self._publish_v3
         clean_session = config.get('cleanSession', None)
         if clean_session is not None:
             kwargs['clean_session'] = clean_session
@@ -97,8 +154,24 @@ class MqttService(Service):
         if credentials := config.get('credentials', False):
             self.client.username_pw_set(self._runner.template_eval(credentials['username']), self._runner.template_eval(credentials['password']))
         self._subscriptions: list[str] = list()
+        self._connect_args = [
+            self._runner.template_eval(config['hostname']),
+            int(self._runner.template_eval(config.get('port', 1883))),
+            config.get('keepAlive', 60),
+        ]
+        self._connect_props: props.Properties|None = None
+        if self.is_v5 and (prop_config := config.get('connectProperties', False)):
+            self._connect_props = props.Properties(PacketTypes.CONNECT)
+            if (s_e_i := prop_config.get('sessionExpiryInterval', False)) is not False:
+                self._connect_props.SessionExpiryInterval = int(self._runner.template_eval(s_e_i))
+            if (r_m := prop_config.get('receiveMaximum', False)) is not False:
+                self._connect_props.ReceiveMaximum = int(self._runner.template_eval(r_m))
+            if (m_p_s := prop_config.get('maximumPacketSize', False)) is not False:
+                self._connect_props.MaximumPacketSize = int(self._runner.template_eval(m_p_s))
 
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "properties": {
                 "hostname": {
@@ -116,6 +189,10 @@ class MqttService(Service):
                     "enum": [3.1, 3.11, 5],
                     "default": 3.11,
                 },
+                "protocol": {
+                    "type": "number",
+                    "enum": [3.1, 3.11, 5],
+                },
                 "connectProperties": {
                     "type": "object",
                     "properties": {
@@ -151,25 +228,12 @@ class MqttService(Service):
         }
 
     def setup(self):
-        args = [
-            self._runner.template_eval(self._config['hostname']),
-            int(self._runner.template_eval(self._config.get('port', 1883))),
-            self._config.get('keepAlive', 60),
-        ]
-        kwargs = dict()
-        if self.is_v5:
-            prop_config = self._config.get('connectProperties', dict())
-            connect_props = props.Properties(PacketTypes.CONNECT)
-            if s_e_i := prop_config.get('sessionExpiryInterval', False) is not False:
-                connect_props.SessionExpiryInterval = int(self._runner.template_eval(s_e_i))
-            if r_m := prop_config.get('receiveMaximum', False) is not False:
-                connect_props.ReceiveMaximum = int(self._runner.template_eval(r_m))
-            if m_p_s := prop_config.get('maximumPacketSize', False) is not False:
-                connect_props.MaximumPacketSize = int(self._runner.template_eval(m_p_s))
-            if len(prop_config) > 0:
-                kwargs['properties'] = connect_props
-        self._logger.debug(f"MQTT connecting with {args} {kwargs}")
-        self.client.connect(*args, **kwargs)
+        args = self._connect_args
+        self._logger.debug("MQTT connecting with %s %s", args, self._connect_props)
+        # Subscription callbacks run on this worker instead of paho's network thread, so slow message
+        # handling doesn't hold up reading from the socket.  A single worker keeps messages in order.
+        self._dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="MqttDispatch")
+        self.client.connect(*args, properties=self._connect_props)
         self.client.loop_start()
     
     def reset(self):
@@ -180,37 +244,72 @@ class MqttService(Service):
     def teardown(self):
         self.client.disconnect()
         self.client.loop_stop()
+        self._dispatcher.shutdown(wait=True)
 
-    def publish(self, topic:str, payload:str|None, qos:int=0, retain:bool=False, properties:props.Properties|None=None):
-        kwargs = {
-            "topic": topic,
-            "payload": payload,
-            "qos": qos,
-            "retain": retain,
-        }
-        if self.is_v5 and properties is not None:
-            kwargs['properties'] = properties
-        self.client.publish(**kwargs)
+    def _publish_v3(self, topic:str, payload:str|None, qos:int=0, retain:bool=False, properties:props.Properties|None=None):
+        # Publish properties only exist in MQTTv5, so they are dropped.
+        self.client.publish(topic, payload, qos, retain)
+
+    def _publish_v5(self, topic:str, payload:str|None, qos:int=0, retain:bool=False, properties:props.Properties|None=None):
+        self.client.publish(topic, payload, qos, retain, properties)
     
+    def _dispatch(self, callback:Callable[[mqtt_client.Client,Any,str], None], client:mqtt_client.Client, userdata:Any, message):
+        try:
+            callback(client, userdata, message)
+        except Exception:
+            self._logger.exception("Failed to handle message received via %s", message.topic)
+
     def subscribe(self, sub_topic:str, qos:int, callback:Callable[[mqtt_client.Client,Any,str], None]):
-        self.client.message_callback_add(sub_topic, callback)
+        def on_message(client:mqtt_client.Client, userdata:Any, message):
+            self._dispatcher.submit(self._dispatch, callback, client, userdata, message)
+        self.client.message_callback_add(sub_topic, on_message)
         self._subscriptions.append(sub_topic)
         self.client.subscribe(sub_topic, qos)
 
 class MqttPublish(TestStep):
 
+    __slots__ = ('_serv_dep', '_topic', '_qos', '_retain', '_batch', '_pub_props', '_payload')
+
     def __init__(self, runner: DugwayRunner, config: JsonConfigType):
-        serv_dep_cap = ServiceDependency(runner, config)
-        super().__init__(runner, config, [serv_dep_cap])
-        self._topic = config.get('topic')
+        self._serv_dep = ServiceDependency(runner, config)
+        super().__init__(runner, config, [self._serv_dep])
+        self._topic = self._runner.template_eval(config.get('topic'))
         self._qos = config.get('qos', 0)
         self._retain = config.get('retain', False)
-        if (json_payload := config.get('json', None)) is not None:
-            self._payload = json.dumps(json_payload)
+        self._batch = config.get('batch', False)
+        json_payload = config.get('json', None)
+        if self._batch and (not isinstance(json_payload, list) or config.get('nullPayload', False)):
+            raise expectations.InvalidTestConfig("A batch publish needs a list of JSON payloads")
+        if json_payload is not None:
+            # Serialized to bytes once so paho doesn't need to encode the payload on every publish.
+            if self._batch:
+                self._payload = encode_batch([orjson.dumps(item, default=_json_default) for item in json_payload])
+            else:
+                self._payload = orjson.dumps(json_payload, default=_json_default)
         if config.get('nullPayload', False):
             self._payload = None
+        # Publish properties are fixed by the config, so they are built once and reused by every run.
+        self._pub_props: props.Properties|None = None
+        if pub_prop_config := config.get('publishProperties', False):
+            self._pub_props = props.Properties(PacketTypes.PUBLISH)
+            if (p_f_i := pub_prop_config.get('payloadFormatIndicator', False)) is not False:
+                self._pub_props.PayloadFormatIndicator = int(p_f_i)
+            if (m_e_i := pub_prop_config.get('messageExpiryInterval', False)) is not False:
+                self._pub_props.MessageExpiryInterval = int(m_e_i)
+            if (r_t := pub_prop_config.get('responseTopic', False)) is not False:
+                self._pub_props.ResponseTopic = str(r_t)
+            if (c_d := pub_prop_config.get('correlationData', False)) is not False:
+                self._pub_props.CorrelationData = c_d.encode()
+            if (c_t := pub_prop_config.get('contentType', False)) is not False:
+                self._pub_props.ContentType = str(c_t)
+        if self._batch:
+            if self._pub_props is None:
+                self._pub_props = props.Properties(PacketTypes.PUBLISH)
+            set_batch_properties(self._pub_props, len(json_payload))
 
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "properties": {
                 "topic": {
@@ -225,6 +324,10 @@ class MqttPublish(TestStep):
                     "default": False
                 },
                 "publishProperties": MqttPropertiesComparingCapability.publish_property_schema(),
+                "batch": {
+                    "type": "boolean",
+                    "default": False
+                },
             },
             "oneOf": [
                 {
@@ -240,7 +343,7 @@ class MqttPublish(TestStep):
                             "const": True,
                         }
                     },
-                    "required": ["null_payload"],
+                    "required": ["nullPayload"],
                 },
             ],
             "required": [
@@ -249,39 +352,28 @@ class MqttPublish(TestStep):
         }
 
     def run(self):
-        pub_args = [
-            self._topic,
-            self._payload,
-            self._qos,
-            self._retain
-        ]
-        mqtt_service = self.get_capability("ServiceDependency").get_service()
-        if mqtt_service.is_v5 and (pub_prop_config := self._config.get('publishProperties', False)):
-            pub_props = props.Properties(PacketTypes.PUBLISH)
-            if (p_f_i := pub_prop_config.get('payloadFormatIndicator', False)) is not False:
-                pub_props.PayloadFormatIndicator = int(p_f_i)
-            if (m_e_i := pub_prop_config.get('messageExpiryInterval', False)) is not False:
-                pub_props.MessageExpiryInterval = int(m_e_i)
-            if (r_t := pub_prop_config.get('responseTopic', False)) is not False:
-                pub_props.ResponseTopic = str(r_t)
-            if (c_d := pub_prop_config.get('correlationData', False)) is not False:
-                pub_props.CorrelationData = c_d.encode()
-            if (c_t := pub_prop_config.get('contentType', False)) is not False:
-                pub_props.ContentType = str(c_t)
-            pub_args.append(pub_props)
-        mqtt_service.publish(*pub_args)
+        mqtt_service = self._serv_dep.get_service()
+        if self._batch and not mqtt_service.is_v5:
+            raise expectations.InvalidTestConfig("Batch publishing requires MQTTv5")
+        mqtt_service.publish(self._topic, self._payload, self._qos, self._retain, self._pub_props)
 
 
 class MqttSubscribe(TestStep):
 
+    __slots__ = ('_serv_dep', '_json_filter', '_json_multi', '_mqtt_prop_comp', '_topic', '_qos')
+
     def __init__(self, runner: DugwayRunner, config: JsonConfigType):
-        serv_dep_cap = ServiceDependency(runner, config)
+        self._serv_dep = ServiceDependency(runner, config)
         self._json_filter = JsonSchemaFilter(runner, config)
-        self._json_multi = JsonMultiContent(runner, config)
+        self._json_multi = JsonMultiContentCapability(runner, config)
         self._mqtt_prop_comp = MqttPropertiesComparingCapability(runner, config, "filter")
-        super().__init__(runner, config, [serv_dep_cap, self._json_multi, self._json_filter])
+        super().__init__(runner, config, [self._serv_dep, self._json_multi, self._json_filter])
+        self._topic = self._runner.template_eval(config.get('topic'))
+        self._qos = int(self._runner.template_eval(config.get('qos', 0)))
 
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "properties": {
                 "topic": {
@@ -296,31 +388,42 @@ class MqttSubscribe(TestStep):
     
     def _receive_message(self, client: mqtt_client.Client, userdata: Any, message):
         self._logger.debug("Received message via %s", message.topic)
-        if not self._json_filter.check_against_json_schema(message.payload.decode('utf-8')):
-            self._logger.debug("Filtered out a message that didn't validate against json schema")
-            return
-        if not self._mqtt_prop_comp.properties_match(message.properties):
+        if self._mqtt_prop_comp.is_filtering and not self._mqtt_prop_comp.properties_match(message.properties):
             self._logger.debug("Filtered out a message that didn't match MQTTv5 properties")
             return
+        # The payload is deserialized once here and shared by the filter and the stored content.
+        # Only JSON messages are kept, so a message that isn't JSON never counts towards expect.count,
+        # whether or not a filter is configured.
         try:
-            deserialized_json = json.loads(message.payload)
-        except json.decoder.JSONDecodeError:
-            raise expectations.ExpectationFailure("Message Format", "JSON Formatted Message". message.payload)
+            deserialized_json = orjson.loads(message.payload)
+        except orjson.JSONDecodeError:
+            self._logger.debug("Filtered out a message that wasn't JSON")
+            return
+        if self._json_filter.is_filtering and not self._json_filter.check_json_value(deserialized_json):
+            self._logger.debug("Filtered out a message that didn't validate against json schema")
+            return
         self._json_multi.add_content(deserialized_json)
 
     def run(self):
-        mqtt_service = self.get_capability("ServiceDependency").get_service()
-        mqtt_service.subscribe(self._runner.template_eval(self._config.get('topic')), int(self._runner.template_eval(self._config.get('qos', 0))), self._receive_message)
+        mqtt_service = self._serv_dep.get_service()
+        mqtt_service.subscribe(self._topic, self._qos, self._receive_message)
 
 
 class MqttMessage(TestStep):
 
+    __slots__ = ('_from_step', '_js_expect', '_expect_count', '_timeout_seconds', '_consume_count')
+
     def __init__(self, runner: DugwayRunner, config: JsonConfigType):
-        from_step = FromStep(runner, config)
+        self._from_step = FromStep(runner, config)
         self._js_expect = JsonSchemaExpectation(runner, config)
-        super().__init__(runner, config, [from_step, self._js_expect])
+        super().__init__(runner, config, [self._from_step, self._js_expect])
+        self._expect_count: int|None = config.get('expect', dict()).get('count', None)
+        self._timeout_seconds: float|None = config.get('timeoutSeconds', None)
+        self._consume_count: int|str = config.get('consume', 'all')
 
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "properties": {
                 "consume": {
@@ -350,29 +453,18 @@ class MqttMessage(TestStep):
             raise expectations.FailedTestStep("Message payload did not match the JSON schema")
 
     def run(self):
-        if (timeoutSeconds := self._config.get('timeoutSeconds', None)) is not None:
-            timeout_time = datetime.now() + timedelta(seconds=timeoutSeconds)
-        from_step = self.get_capability("FromStep").get_step()
-        if json_multi := from_step.find_capability("JsonMultiResponse"):
-            if expect := self._config.get('expect', dict()):
-                if (expect_count := expect.get('count', None)) is not None:
-                    while timeout_time is None or timeout_time > datetime.now():
-                        if expect_count == json_multi.count:
-                            break
-                        else:
-                            logger.debug("Waiting for message")
-                            sleep(1)
-                    else:
-                        failure = expectations.ExpectationFailure(f"Message count", expect_count, json_multi.count)
-                        print(from_step)
-                        raise failure
-            consume_count = self._config.get('consume', 'all')
+        from_step = self._from_step.get_step()
+        if json_multi := from_step.find_capability("JsonMultiContent"):
+            if (expect_count := self._expect_count) is not None:
+                if not json_multi.wait_for_count(expect_count, self._timeout_seconds) or json_multi.count != expect_count:
+                    raise expectations.ExpectationFailure("Message count", expect_count, json_multi.count)
+            consume_count = self._consume_count
             if consume_count == 'all':
                 consume_count = json_multi.count
             for _ in range(consume_count):
                 json_msg = json_multi.get()
                 self.check_json(json_msg)
-        elif js_resp_bod := from_step.find_capability("JsonResponseBody"):
+        elif js_resp_bod := from_step.find_capability("JsonContent"):
             self.check_json(js_resp_bod.json_content)
         else:
-            raise expectations.TestStepMissingCapability("No JsonMultiResponse or JsonResponseBody capability found")
+            raise expectations.TestStepMissingCapability("No JsonMultiContent or JsonContent capability found")
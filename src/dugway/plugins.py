@@ -0,0 +1,15 @@
+from importlib.metadata import entry_points
+import functools
+
+STEP_PLUGIN_GROUP = 'dugwayteststep'
+SERVICE_PLUGIN_GROUP = 'dugwayservice'
+
+@functools.cache
+def load_plugin(group: str, name: str) -> type|None:
+    """ Returns the class registered as `name` in the entry point group, or None if there isn't one.
+    Only that entry point is imported, so a suite never loads plugins it doesn't use.
+    Errors raised while importing the plugin are left to propagate.
+    """
+    for entry_point in entry_points(group=group, name=name):
+        return entry_point.load()
+    return None
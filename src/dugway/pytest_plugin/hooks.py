@@ -1,35 +1,25 @@
 import logging
 import logging.config
 from typing import Optional
-import os
-import re
 import pathlib
 
 import pytest
 
 from .file import DugwayFile
-import dugway.exceptions
 
+DUGWAY_FILE_SUFFIXES = (".dugway.yaml", ".dugway.yml")
 
-def pytest_collect_file(parent, path: os.PathLike) -> Optional[DugwayFile]:
+logger = logging.getLogger(__name__)
+
+
+def pytest_collect_file(parent, file_path: pathlib.Path) -> Optional[DugwayFile]:
     """On collecting files, get any files that end in .dugway.yaml or .dugway.yml as dugway
     test files
     """
 
-    pattern = r".+\.dugway\.ya?ml$"
-
-    try:
-        compiled = re.compile(pattern)
-    except Exception as e:
-        raise dugway.exceptions.InvalidConfigurationException(e) from e
-
-    match_dugway_file = compiled.search
-
-    path = pathlib.Path(path)
-
-    if match_dugway_file(str(path)):
-        print(f"Loading {path}")
-        dugway_file = DugwayFile.from_parent(parent, path=path)
+    if file_path.name.endswith(DUGWAY_FILE_SUFFIXES):
+        logger.debug("Loading %s", file_path)
+        dugway_file = DugwayFile.from_parent(parent, path=file_path)
         return dugway_file
 
     return None
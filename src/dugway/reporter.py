@@ -1,9 +1,11 @@
 
 from abc import ABC, abstractmethod
-from functools import partial
-from io import StringIO
+from functools import partial, cache
+import inspect
+from io import BytesIO
+import sys
 
-import junit_xml
+import xml.etree.ElementTree as ElementTree
 from rich.tree import Tree
 from rich.live import Live
 from rich.spinner import Spinner
@@ -41,7 +43,10 @@ class AbstractReporter(ABC):
     def start_step(self, step_name: str):
         ...
 
-    def step_info(self, title, data):
+    def step_info(self, title, data, kind: str='auto'):
+        """ Reports information about the current step.  `kind` is 'protobuf' when the data
+        may be an encoded protobuf message, and 'auto' otherwise.
+        """
         ...
 
     def end_step(self, result: bool):
@@ -53,33 +58,71 @@ class AbstractReporter(ABC):
     def step_failure(self, title, data):
         ...
 
+@cache
+def step_info_takes_kind(reporter_class: type) -> bool:
+    """ True if the reporter class's step_info() accepts the `kind` argument.  Checked once per class.
+    """
+    try:
+        signature = inspect.signature(reporter_class.step_info)
+    except (TypeError, ValueError):
+        return True
+    positional = 0
+    for parameter in signature.parameters.values():
+        if parameter.kind == inspect.Parameter.VAR_POSITIONAL:
+            return True
+        if parameter.kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD):
+            positional += 1
+    return positional >= 4 # self, title, data and kind
+
 class MultiReporter:
 
     def __init__(self, reporters: list[AbstractReporter]):
         self.reporters = reporters
 
-    def __getattr__(self, funcname):
-        def method(*args, **kwargs):
-            for reporter in self.reporters:
-                func = getattr(reporter, funcname)
-                func(*args, **kwargs)
-
-        return method
-
     def start_suite(self, suite_name):
         for reporter in self.reporters:
             reporter.start_suite(suite_name)
+
+    def end_suite(self, result: bool):
+        for reporter in self.reporters:
+            reporter.end_suite(result)
     
     def start_case(self, case_name):
         for reporter in self.reporters:
             reporter.start_case(case_name)
+
+    def end_case(self, result: bool):
+        for reporter in self.reporters:
+            reporter.end_case(result)
     
     def start_step(self, step_name):
         for reporter in self.reporters:
             reporter.start_step(step_name)
 
+    def step_info(self, title, data, kind: str='auto'):
+        # Reporters written before `kind` existed only take a title and data, so they are called without it.
+        for reporter in self.reporters:
+            if step_info_takes_kind(type(reporter)):
+                reporter.step_info(title, data, kind)
+            else:
+                reporter.step_info(title, data)
+
+    def end_step(self, result: bool):
+        for reporter in self.reporters:
+            reporter.end_step(result)
+
+    def add_service(self, service_name):
+        for reporter in self.reporters:
+            reporter.add_service(service_name)
+
+    def step_failure(self, title, data):
+        for reporter in self.reporters:
+            reporter.step_failure(title, data)
+
 class MyRichStatus:
 
+    __slots__ = ('_text', '_status_type', 'done', 'failed')
+
     def __init__(self, status_type, text):
         self._text = text
         self._status_type = status_type
@@ -102,19 +145,21 @@ class MyRichStatus:
     
 
 def create_rich_table(data:dict[str,str]) -> Table:
-    table = Table()
+    table = Table(show_header=False)
     for k,v in data.items():
         table.add_row(k, v)
     return table
 
-def create_rich_text(data:str):
-    if '\n' in data:
+def create_rich_text(data:str, kind:str='auto'):
+    # Encoded protobuf often contains newline bytes, so it is tried before treating data as multi-line text.
+    if kind == 'protobuf' and (inspectedpb := try_display_raw_protobuf(data)):
+        # The inspector colours its output with ANSI escape codes.
+        return Text.from_ansi(inspectedpb)
+    elif '\n' in data:
         return Syntax(data, "text", line_numbers=True)
-    elif inspectedpb := try_display_raw_protobuf(data):
-        return Text(inspectedpb)
     return data
 
-def create_rich_panel(title:str, data:str|dict[str,str]|list[str|dict[str,str]]|FailedTestStep|None=None, error_panel:bool=False) -> Panel|Text|Table:
+def create_rich_panel(title:str, data:str|dict[str,str]|list[str|dict[str,str]]|FailedTestStep|None=None, error_panel:bool=False, kind:str='auto') -> Panel|Text|Table:
     kwargs = dict()
     if error_panel:
         kwargs['style'] = "red"
@@ -122,20 +167,60 @@ def create_rich_panel(title:str, data:str|dict[str,str]|list[str|dict[str,str]]|
         return Text(title)
     else:
         if isinstance(data, str):
-            return Panel(create_rich_text(data), title=title, width=80, **kwargs)
+            return Panel(create_rich_text(data, kind), title=title, width=80, **kwargs)
         elif isinstance(data, dict):
-            table = create_rich_table(data)
+            return Panel(create_rich_table(data), title=title, width=80, **kwargs)
         elif isinstance(data, list):
-            ...
+            return Panel(create_rich_text("\n".join(map(str, data))), title=title, width=80, **kwargs)
         elif isinstance(data, Exception):
             return Panel(Traceback.from_exception(type(data), data, data.__traceback__))
 
-def try_display_raw_protobuf(data) -> str|None:
+class LazyPanel:
+    """ Builds the renderable for a piece of step information the first time it is drawn.
+    Passing cases are collapsed, so the information under them is usually never built.
+    """
+
+    __slots__ = ('_title', '_data', '_kind', '_panel')
+
+    def __init__(self, title:str, data=None, kind:str='auto'):
+        self._title = title
+        self._data = data
+        self._kind = kind
+        self._panel = None
+
+    def __rich_console__(self, console, options):
+        if self._panel is None:
+            # This is drawn on the live display's refresh thread, so data that can't be shown as a panel
+            # falls back to its repr rather than breaking the display.
+            try:
+                self._panel = create_rich_panel(self._title, self._data, kind=self._kind)
+            except Exception:
+                self._panel = None
+            if self._panel is None:
+                self._panel = Text(f"{self._title}: {self._data!r}")
+        yield self._panel
+
+PROTOBUF_WIRE_TYPES = (0, 1, 2, 3, 5)
+
+def try_display_raw_protobuf(data: str|bytes) -> str|None:
+    """ Returns a description of the data as an encoded protobuf message, or None if it isn't one.
+    Text must hold one character per byte (as decoded with latin-1) to be parsed.
+    """
+    if isinstance(data, str):
+        # Encoded protobuf always contains control characters, so printable text is rejected without a parser.
+        if data.isprintable():
+            return None
+        try:
+            data = data.encode('latin-1')
+        except UnicodeEncodeError:
+            return None
+    # The first byte starts the first field's key, whose low three bits must be a known wire type.
+    if len(data) == 0 or (data[0] & 0x07) not in PROTOBUF_WIRE_TYPES:
+        return None
+    # A new parser is made for each message, since parsing updates the parser's own state.
     parser = ProtobufParser()
-    f = StringIO(data)
     try:
-        output = parser.parse_message(f, "message")
-        return output
+        return parser.parse_message(BytesIO(data), "message")
     except Exception:
         return None
 
@@ -145,7 +230,9 @@ class RichReporter(AbstractReporter):
         super(RichReporter, self).__init__()
         self.tree = Tree("Dugway")
         self.tree.hide_root = True
-        self.display = Live(self.tree, vertical_overflow="visible")
+        # The display redraws itself a few times a second, so finished steps and cases are picked up
+        # without redrawing the whole tree for each one.  Only failures and the end of the suite force a redraw.
+        self.display = Live(self.tree, auto_refresh=True, refresh_per_second=4, vertical_overflow="visible")
         self.services = []
         self.current_suite_tree: Tree = None
         self.current_suite_spinner: MyRichStatus = None
@@ -181,49 +268,99 @@ class RichReporter(AbstractReporter):
         self.current_case_tree.label = self.current_case_spinner.finish(failed=(not result))
         if result:
             self.current_case_tree.expanded = False
-        self.display.refresh()
 
     def start_step(self, step_name):
         self.current_step_spinner = MyRichStatus("Step", step_name)
         self.current_step_tree = self.current_case_tree.add(self.current_step_spinner.r())
     
-    def step_info(self, title, data):
-        self.current_step_tree.add(create_rich_panel(title, data))
+    def step_info(self, title, data, kind='auto'):
+        self.current_step_tree.add(LazyPanel(title, data, kind))
 
     def step_failure(self, title, data=None):
         self.current_step_tree.add(create_rich_panel(str(data.__class__), data, error_panel=True))
-        self.display.refresh()
         self.end_step(False)
+        self.display.refresh()
 
     def end_step(self, result):
         self.current_step_tree.label = self.current_step_spinner.finish(failed=(not result))
-        self.display.refresh()
     
+class PlainReporter(AbstractReporter):
+    """ Writes a line of plain text for each event.  This is for output that isn't a terminal,
+    such as CI logs, where the live tree drawn by RichReporter can't be shown.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__()
+        self._stream = stream if stream is not None else sys.stdout
+        self._step_name = ''
+
+    def _line(self, depth: int, text: str):
+        self._stream.write(f"{'  ' * depth}{text}\n")
+
+    def add_service(self, service_name):
+        self._line(1, f"Service: {service_name}")
+
+    def start_suite(self, suite_name):
+        self._line(0, f"Suite: {suite_name}")
+
+    def end_suite(self, result):
+        self._line(0, f"Suite {'passed' if result else 'FAILED'}")
+        self._stream.flush()
+
+    def start_case(self, case_name):
+        self._line(1, f"Case: {case_name}")
+
+    def end_case(self, result):
+        self._line(1, f"Case {'passed' if result else 'FAILED'}")
+
+    def start_step(self, step_name):
+        self._step_name = step_name
+
+    def step_info(self, title, data, kind='auto'):
+        self._line(3, f"{title}: {data}")
+
+    def step_failure(self, title, data=None):
+        self._line(3, f"{title}: {data}")
+        self.end_step(False)
+
+    def end_step(self, result):
+        self._line(2, f"Step {self._step_name}: {'passed' if result else 'FAILED'}")
+
 class JunitReporter(AbstractReporter):
 
     def __init__(self, filename):
         super().__init__()
         self._filename = filename
         self.suite_name = ''
-        self.test_cases = []
-
-    def __del__(self):
-        ts = junit_xml.TestSuite(self.suite_name, self.test_cases)
-        try:
-            with open(self._filename, 'w') as fp:
-                junit_xml.TestSuite.to_file(fp, [ts])
-        except NameError:
-            pass
+        # Each test case is held as [name, failure message or None] until the suite ends.
+        self.test_cases: list[list[str|None]] = []
+
+    def write(self):
+        """ Writes the results collected so far to the JUnit XML file.
+        """
+        failures = str(sum(1 for _, failure in self.test_cases if failure is not None))
+        tests = str(len(self.test_cases))
+        root = ElementTree.Element("testsuites", disabled="0", errors="0", failures=failures, tests=tests, time="0.0")
+        suite = ElementTree.SubElement(root, "testsuite", disabled="0", errors="0", failures=failures, name=self.suite_name, skipped="0", tests=tests, time="0")
+        for case_name, failure in self.test_cases:
+            case = ElementTree.SubElement(suite, "testcase", name=case_name)
+            if failure is not None:
+                ElementTree.SubElement(case, "failure", type="failure", message=failure)
+        ElementTree.indent(root, space="\t")
+        ElementTree.ElementTree(root).write(self._filename, encoding="utf-8", xml_declaration=True)
     
     def start_suite(self, suite_name):
         self.suite_name = suite_name
+
+    def end_suite(self, result):
+        self.write()
     
     def start_case(self, case_name):
-        self.test_cases.append(junit_xml.TestCase(case_name))
+        self.test_cases.append([case_name, None])
     
     def end_case(self, result):
         if result is False:
-            self.test_cases[-1].add_failure_info("Failed")
+            self.test_cases[-1][1] = "Failed"
     
     def start_step(self, step_name):
         pass
@@ -235,7 +372,7 @@ if __name__ == '__main__':
     rr.start_step("Hello")
     rr.step_info("String", "This is some text")
     rr.step_info("Multiline", "Line one\nLine two\nLine three")
-    #rr.step_info("List", ["Thing One", "Thing Two", "Thing Three"])
+    rr.step_info("List", ["Thing One", "Thing Two", "Thing Three"])
     rr.end_step(True)
     rr.start_step("Goodbye")
     rr.end_step(False)
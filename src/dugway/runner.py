@@ -3,17 +3,19 @@ from typing import Any, Tuple, Iterator
 from abc import abstractmethod
 import os
 import logging
+import functools
 
 from jacobsjsondoc.document import create_document
 from jacobsjsondoc.options import ParseOptions, RefResolutionMode
-from stevedore import driver
-from jinja2 import Environment as Jinja2Environment
+from jinja2 import Environment as Jinja2Environment, Template as Jinja2Template
 
 from .meta import JsonSchemaType, JsonConfigType
 from .meta_class import JsonSchemaDefinedObject
 from .reporter import AbstractReporter
 from .case import TestCase
 from .service import Service
+from .expectations import InvalidTestConfig
+from .plugins import load_plugin, SERVICE_PLUGIN_GROUP
 
 
 class TestSuite(JsonSchemaDefinedObject):
@@ -21,6 +23,8 @@ class TestSuite(JsonSchemaDefinedObject):
     A TestSuite contains 1+ services and 1+ test cases.
     """
 
+    __slots__ = ('_name', '_runner', '_services', '_cases', '_reporter', '_variables', '_current_case')
+
     def __init__(self, name: str, runner, config: dict[str, Any], reporter: AbstractReporter):
         super().__init__(config)
         self._name = os.path.basename(name)
@@ -43,16 +47,10 @@ class TestSuite(JsonSchemaDefinedObject):
 
     def add_service(self, service_name, service_config):
         service_type = service_config.get('type')
-        service_mgr = driver.DriverManager(
-            namespace='dugwayservice',
-            name=service_type,
-            invoke_on_load=True,
-            invoke_kwds={
-                "runner": self._runner,
-                "config": service_config,
-            }
-        )
-        self._services[service_name] = service_mgr.driver
+        service_class = load_plugin(SERVICE_PLUGIN_GROUP, service_type)
+        if service_class is None:
+            raise InvalidTestConfig(f"No service of type '{service_type}' is installed")
+        self._services[service_name] = service_class(runner=self._runner, config=service_config)
 
     @property
     def name(self):
@@ -70,7 +68,6 @@ class TestSuite(JsonSchemaDefinedObject):
 
     def do_setup(self):
         for service_name, service in self._services.items():
-            self._reporter.add_service
             self._reporter.add_service(service_name)
             service.setup()
 
@@ -82,17 +79,18 @@ class TestSuite(JsonSchemaDefinedObject):
         for case_name, test_case in self._cases.items():
             yield (case_name, test_case)
 
-    def do_test_case_execution(self, case_name: str, test_case: TestCase):
+    def do_test_case_execution(self, case_name: str, test_case: TestCase) -> bool:
         self._reporter.start_case(case_name)
         self._current_case = test_case
         result = test_case.run()
         for service in self._services.values():
             service.reset()
         self._reporter.end_case(result)
+        return result
 
     def run(self) -> bool:
         self._reporter.start_suite(self._name)
-        print(f"starting suite with {len(self._services)} services")
+        self._runner.logger.debug("Starting suite with %d services", len(self._services))
         self.do_setup()
         result = True
         for case_name, test_case in self.iterate_test_cases():
@@ -103,6 +101,7 @@ class TestSuite(JsonSchemaDefinedObject):
         return result
 
     @classmethod
+    @functools.cache
     def get_generic_schema(cls) -> JsonSchemaType:
         return {
             "type": "object",
@@ -138,6 +137,7 @@ class DugwayRunner:
         }
         self.jinja2_env = Jinja2Environment()
         self.jinja2_env.globals.update(self.globals)
+        self._templates: dict[str, Jinja2Template] = dict()
         self._reporter = reporter
         self._suite = TestSuite(filename, self, self._config, self._reporter)
 
@@ -151,26 +151,42 @@ class DugwayRunner:
     def get_suite(self) -> TestSuite:
         return self._suite
 
+    def get_template(self, source: str) -> Jinja2Template:
+        """ Returns the compiled template for the source string, compiling it only the first time it is seen.
+        """
+        try:
+            return self._templates[source]
+        except KeyError:
+            template = self._templates[source] = self.jinja2_env.from_string(source)
+            return template
+
+    def _is_literal(self, source: str) -> bool:
+        """ True if rendering the source would return it unchanged, so there is no need to involve Jinja2.
+        Jinja2 drops a single trailing newline, so sources ending in one still go through it.
+        """
+        env = self.jinja2_env
+        return (env.variable_start_string not in source
+            and env.block_start_string not in source
+            and env.comment_start_string not in source
+            and not source.endswith('\n'))
+
     def template_eval(self, element: str|list[Any]|dict[str,Any], context:dict[str,Any]|None=None):
         if isinstance(element, str):
-            template = self.jinja2_env.from_string(element)
+            if self._is_literal(element):
+                return str(element)
+            template = self.get_template(element)
             if context is None:
                 return template.render()
             else:
                 return template.render(context)
-        elif isinstance(element, int):
-            template = self.jinja2_env.from_string(str(element))
-            if context is None:
-                return int(template.render())
-            else:
-                return int(template.render(context))
         elif isinstance(element, bool):
-            template = self.jinja2_env.from_string(str(element))
-            if context is None:
-                v = template.render()
-            else:
-                v = template.render(context)
-            return v is True or v.lower == 'true' or v == 1
+            # Checked before int, since bool is a subclass of int.  A bool can't contain template syntax.
+            return element
+        elif isinstance(element, int):
+            # The text of an integer can't contain template syntax.
+            return int(element)
+        elif isinstance(element, float):
+            return float(element)
 
     def run(self):
         self._suite.run()
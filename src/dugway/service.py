@@ -1,6 +1,7 @@
 
 
 import logging
+import functools
 
 from .meta_class import JsonSchemaDefinedObject, JsonConfigType, JsonSchemaType
 
@@ -15,12 +16,15 @@ class Service(JsonSchemaDefinedObject):
     should inherit from this base class.
     """
 
+    __slots__ = ('_runner', '_logger')
+
     def __init__(self, runner, config: JsonConfigType, capabilities=[]):
         super().__init__(config=config, capabilities=capabilities)
         self._runner = runner
         self._logger = logging.getLogger(__class__.__name__)
 
     @classmethod
+    @functools.cache
     def get_generic_schema(cls) -> JsonSchemaType:
         return {
             "type": "object",
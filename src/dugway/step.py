@@ -1,6 +1,7 @@
 
 from abc import abstractmethod
 import logging
+import functools
 
 from .meta import JsonConfigType, JsonSchemaType
 from .meta_class import JsonSchemaDefinedObject
@@ -17,6 +18,8 @@ class TestStep(JsonSchemaDefinedObject):
     Subsequent test steps can reference previous ones.  For example a "message received" test step may
     find received messages from a previous "subscribe to messages" test step.
     """
+
+    __slots__ = ('_runner', '_logger')
     
     def __init__(self, runner, config: JsonConfigType, capabilities: list[JsonSchemaDefinedCapability]|None=None):
         super().__init__(config, capabilities)
@@ -27,6 +30,7 @@ class TestStep(JsonSchemaDefinedObject):
         return self._config.get('id', dfault)
 
     @classmethod
+    @functools.cache
     def get_generic_schema(cls) -> JsonSchemaType:
         return {
             "properties": {
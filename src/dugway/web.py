@@ -1,5 +1,5 @@
 from typing import Any
-from copy import copy
+import functools
 
 import httpx
 from jacobsjsonschema.draft7 import Validator as JsonSchemaValidator
@@ -13,12 +13,16 @@ from .expectations import ExpectationFailure
 
 class HttpService(Service):
 
+    __slots__ = ('_headers', '_hostname', '_tls', '_port', '_base_url', '_client')
+
     def __init__(self, runner, config):
         super().__init__(runner, config)
         self._headers = { k:self._runner.template_eval(v) for (k,v) in config.get('headers', dict()).items() }
         self._hostname = self._runner.template_eval(config.get('hostname'))
         self._tls = config.get('tls', False)
         self._port = config.get('port', 443 if self._tls else 80)
+        self._base_url = f"http{self._tls and 's' or ''}://{self._hostname}:{self._port}"
+        self._client: httpx.Client|None = None
 
     @classmethod
     def get_headers_schema(cls):
@@ -29,7 +33,9 @@ class HttpService(Service):
             },
         }
 
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "properties": {
                 "hostname": {
@@ -51,29 +57,46 @@ class HttpService(Service):
     
     def get_url(self, path: str) -> str:
         evaluated_path = self._runner.template_eval(path)
-        url = f"http{self._tls and 's' or ''}://{self._hostname}:{self._port}{evaluated_path}"
-        return url
+        return self._base_url + evaluated_path
 
     def make_request(self, method: str, path: str, **httpx_kwargs):
-        all_headers = copy(self._headers)
-        all_headers.update({ k:self._runner.template_eval(v) for (k,v) in httpx_kwargs.get('headers', dict())})
         url = self.get_url(path)
-        httpx_kwargs['headers'] = all_headers
-        resp = httpx.request(method, url, **httpx_kwargs)
+        resp = self._client.request(method, url, **httpx_kwargs)
         return resp
 
+    def setup(self):
+        # The client pools connections for every request until teardown closes it.
+        # The service's headers are set on the client, which merges them with each request's own headers.
+        self._client = httpx.Client(headers=self._headers)
+
+    def reset(self):
+        # The client is shared by every test case, so cookies set during one case are dropped before the next.
+        self._client.cookies.clear()
+
+    def teardown(self):
+        self._client.close()
+        self._client = None
+
 
 class HttpRequest(TestStep):
 
+    __slots__ = ('serv_dep', 'resp_cap', '_path', '_method', '_expectations', '_headers')
+
     def __init__(self, runner: DugwayRunner, config: JsonConfigType):
         self.serv_dep = ServiceDependency(runner, config)
-        resp_cap = TextContentCapability(runner, config)
-        super().__init__(runner, config, [self.serv_dep, resp_cap])
+        self.resp_cap = TextContentCapability(runner, config)
+        super().__init__(runner, config, [self.serv_dep, self.resp_cap])
         self._path = config.get('path')
         self._method = config.get('method', 'GET')
         self._expectations = config.get('expect', dict())
+        # The request's headers don't change between runs, so they are rendered once.
+        self._headers = { k:runner.template_eval(v) for (k,v) in config.get('headers', dict()).items() }
+        if config.get('json') and 'content-type' not in [h.lower() for h in self._headers.keys()]:
+            self._headers['Content-Type'] = 'application/json'
     
-    def get_config_schema(self) -> JsonSchemaType:
+    @classmethod
+    @functools.cache
+    def get_config_schema(cls) -> JsonSchemaType:
         return {
             "properties": {
                 "headers": HttpService.get_headers_schema(),
@@ -115,23 +138,25 @@ class HttpRequest(TestStep):
         http_service = self.serv_dep.get_service()
         method = self._config.get('method', 'GET')
         self._runner._reporter.step_info(f"{method} Request", http_service.get_url(self._path))
-        headers = self._config.get('headers', dict())
         httpx_kwargs = dict()
         if json_body := self._config.get('json'):
-            if 'content-type' not in [h.lower() for h in headers.keys()]:
-                headers['Content-Type'] = 'application/json'
             httpx_kwargs['json'] = json_body
         elif raw_body := self._config.get('content'):
             httpx_kwargs['content'] = raw_body
         resp = http_service.make_request(
             method,
             self._path,
-            headers=headers,
+            headers=self._headers,
             follow_redirects=self._config.get('follow_redirects', True),
             **httpx_kwargs
         )
-        self._runner._reporter.step_info(f"{resp.status_code} Response", resp.text)
+        # Only bodies declared as protobuf are worth trying to display as protobuf.  Those are
+        # decoded one character per byte, so the reporter can recover the exact bytes.
+        if 'protobuf' in resp.headers.get('content-type', ''):
+            self._runner._reporter.step_info(f"{resp.status_code} Response", resp.content.decode('latin-1'), 'protobuf')
+        else:
+            self._runner._reporter.step_info(f"{resp.status_code} Response", resp.text)
         if expected_status_code := self._expectations.get('status_code'):
             if resp.status_code != expected_status_code:
                 raise ExpectationFailure("Status code", expected_status_code, resp.status_code)
-        self.get_capability("TextContent").response_body = resp.text
+        self.resp_cap.response_body = resp.text